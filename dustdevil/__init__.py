@@ -1,3 +1,5 @@
 #!/usr/bin/env python
 
+from dustdevil._version import __version__
+
 # import handler
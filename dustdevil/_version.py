@@ -0,0 +1,2 @@
+# kept free of imports, so the build can read it without importing dustdevil
+__version__ = '0.1.1'
@@ -2,22 +2,10 @@
 
 from __future__ import absolute_import
 
-try:
-    from tornado import database
-except ImportError:
-    database = None
-
-try:
-    import psycopg2
-except ImportError:
-    psycopg2 = None
-
-try:
-    import redis
-    from redis.sentinel import Sentinel
-except ImportError:
-    redis = None
-    Sentinel = None
+import collections
+import copy
+import datetime
+import functools
 
 from dustdevil import session
 
@@ -28,119 +16,294 @@ __license__ = "Apache 2.0"
 __maintainer__ = "Paul Morel"
 __email__ = "paul.morel@tartansolutions.com"
 
+_USER_AGENT = 'User-Agent'
+
+_DEFAULT_SECURITY_MODEL = ()
+
+_CREATE_SESSIONS_DDL = """create table if not exists tornado_sessions (
+    session_id varchar(64) not null primary key,
+    data longtext,
+    expires integer,
+    ip_address varchar(46),
+    user_agent varchar(255)
+    );"""
+
+
+@functools.lru_cache(maxsize=32)
+def _parse_connection_details(storage_class, url):
+    """Memoized storage_class._parse_connection_details(url); parsing
+    is deterministic, so repeated Handler construction reuses it."""
+    return storage_class._parse_connection_details(url)
+
+
+# Storage backends. Each one imports its driver only when it is actually
+# selected and returns a (storage_class, storage_client) pair.
+
+def _init_mysql(url, settings):
+    try:
+        import MySQLdb
+        from dbutils.pooled_db import PooledDB
+    except ImportError:
+        raise Exception('MySQL not supported, missing the mysqlclient and DBUtils Python packages')
+    storage_class = session.MySQLSession
+
+    u, p, host, d, port = _parse_connection_details(storage_class, url)
+
+    # PooledDB keeps up to 8 idle MySQLdb connections for reuse and caps
+    # the total; with blocking=True a query waits for a free connection
+    # instead of failing when the cap is reached
+    storage_client = PooledDB(creator=MySQLdb, mincached=2, maxcached=8,
+                              maxconnections=settings.get('mysql_pool_size', 32), blocking=True,
+                              host=host, port=int(port), user=u, passwd=p, db=d)
+
+    connection = storage_client.connection()
+    try:
+        connection.cursor().execute(_CREATE_SESSIONS_DDL)  # create table if it doesn't exist
+        connection.commit()
+    finally:
+        connection.close()
+
+    return storage_class, storage_client
+
+
+def _init_postgres(url, settings):
+    try:
+        from psycopg2.pool import ThreadedConnectionPool
+    except ImportError:
+        raise Exception('Postgres not supported, missing the psycopg2 Python package')
+    storage_class = session.PostgresSession
+
+    u, p, host, d, port = _parse_connection_details(storage_class, url)
+
+    # sessions borrow a connection from the pool for each query, so
+    # concurrent requests don't serialize on a single connection
+    storage_client = ThreadedConnectionPool(settings.get('pg_min', 1), settings.get('pg_max', 20),
+                                            host=host, port=port, database=d, user=u, password=p)
+
+    return storage_class, storage_client
+
+
+def _init_sqlite(url, settings):
+    # file sessions are stored in an SQLite database, so sqlite:// is
+    # another name for file://
+    return session.FileSession, url[9:]
+
+
+def _init_memcached(url, settings):
+    try:
+        import pylibmc  # pylint: disable=unused-import
+    except ImportError:
+        raise Exception('Memcached not supported, missing the pylibmc Python package')
+    storage_class = session.MemcachedSession
+
+    servers = _parse_connection_details(storage_class, url)
+    storage_client = storage_class.get_client_pool(servers, settings.get('memcached_pool_size', 32))
+
+    return storage_class, storage_client
+
+
+@functools.lru_cache(maxsize=8)
+def _mongodb_collection(host, port, database, pool_size):
+    """Builds the sessions collection and makes sure its indexes exist.
+    Memoized, so handlers created with the same settings share the
+    MongoClient and its socket pool, and the indexes are only ensured
+    once per process."""
+    import pymongo
+
+    client = pymongo.MongoClient(host, port, maxPoolSize=pool_size)
+    collection = client[database]['tornado_sessions']
+    session.MongoDBSession.ensure_indexes(collection)
+    return collection
+
+
+def _init_mongodb(url, settings):
+    try:
+        import pymongo  # pylint: disable=unused-import
+    except ImportError:
+        raise Exception('MongoDB not supported, missing the pymongo Python package')
+    storage_class = session.MongoDBSession
+
+    host, port, d = _parse_connection_details(storage_class, url)
+
+    # pymongo pools its sockets and returns them to the pool after each
+    # operation by itself
+    storage_client = _mongodb_collection(host or 'localhost', int(port or 27017), d,
+                                         settings.get('mongodb_pool_size', 32))
+
+    return storage_class, storage_client
+
+
+@functools.lru_cache(maxsize=8)
+def _redis_client(url, pool_size, pool_timeout, socket_timeout):
+    """Builds the Redis client for url. Memoized, so handlers created
+    with the same settings share the client, its connection pool and,
+    for Sentinel, the discovered master."""
+    import redis
+    import redis.sentinel
+
+    service_name, p, host, d, port = _parse_connection_details(session.RedisSession, url)
+    if service_name:
+        sentinel = redis.sentinel.Sentinel([(host, port)], socket_timeout=socket_timeout)
+        # the sentinel pool has to stay a SentinelConnectionPool to follow
+        # master failovers, so it is only bounded, not made blocking
+        return sentinel.master_for(service_name, max_connections=pool_size)
+
+    pool = redis.BlockingConnectionPool(host=host, port=port, db=d, password=p,
+                                        max_connections=pool_size, timeout=pool_timeout)
+    return redis.Redis(connection_pool=pool)
+
+
+def _init_redis(url, settings):
+    try:
+        import redis  # pylint: disable=unused-import
+    except ImportError:
+        raise Exception('Redis not supported, missing the redis Python package')
+
+    storage_client = _redis_client(url, settings.get('redis_pool_size', 32), settings.get('redis_pool_timeout', 5),
+                                   settings.get('connection_timeout', 1))
+
+    return session.RedisSession, storage_client
+
+
+def _init_dir(url, settings):
+    return session.DirSession, url[6:]
+
+
+def _init_file(url, settings):
+    return session.FileSession, url[7:]
+
+
+_BACKENDS = {
+    'mysql': _init_mysql,
+    'postgresql': _init_postgres,
+    'sqlite': _init_sqlite,
+    'memcached': _init_memcached,
+    'mongodb': _init_mongodb,
+    'redis': _init_redis,
+    'redis+sentinel': _init_redis,
+    'sentinel': _init_redis,
+    'dir': _init_dir,
+    'file': _init_file,
+}
+
+
+class _LocalSessionCache(object):
+
+    """A small in-process cache of stored session state, keyed by session_id.
+    It holds the constructor arguments (BaseSession._state()) rather than
+    session objects, so every request builds its own session and nothing
+    keeps a finished request alive. Entries older than ttl seconds are
+    treated as missing, so changes made by other processes are picked up
+    again shortly."""
+
+    def __init__(self, maxsize, ttl):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()  # oldest first
+
+    def get(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        stored_at, state = entry
+        if session._time() - stored_at > self._ttl:
+            del self._entries[session_id]
+            return None
+        return state
+
+    def pop(self, session_id):
+        self._entries.pop(session_id, None)
+
+    def __setitem__(self, session_id, state):
+        now = session._time()
+        entries = self._entries
+        entries.pop(session_id, None)
+        entries[session_id] = (now, state)
+        # entries are in the order they were stored, so the expired ones
+        # are at the front; with maxsize 0 nothing is kept at all
+        while entries:
+            oldest_id, (stored_at, _) = next(iter(entries.items()))
+            if now - stored_at <= self._ttl and len(entries) <= self._maxsize:
+                break
+            del entries[oldest_id]
+
 
 class Handler(object):
 
     """Dust Devil Main Session Handling Class"""
 
+    __slots__ = ('_static_kw', '_cookie_name', '_duration', '_local_cache', '_load_session', '_new_session',
+                 'storage_class', 'storage_client')
+
     def __init__(self, settings):
 
-        # logger = plogging.get_logger_adapter(__name__, None, None)
-        self.__kw = {'security_model': settings.get('session_security_model', []),
-                     'duration': settings.get('duration', 900),
-                     'regeneration_interval': settings.get('session_regeneration_interval', 240),
-                     'catalog': settings.get('session_catalog', 'tornado_sessions'),
-                     'cookie_name': settings.get('session_cookie_name', 'session_id'),
-                     'field_store': settings.get('session_field_store')
-                     }
+        # settings shared by every session this handler creates, unpacked
+        # as keyword arguments into each load() and constructor call
+        self._static_kw = {
+            'security_model': settings.get('session_security_model', _DEFAULT_SECURITY_MODEL),
+            'duration': settings.get('duration', 900),
+            'regeneration_interval': settings.get('session_regeneration_interval', 240),
+            'catalog': settings.get('session_catalog', 'tornado_sessions'),
+            'cookie_name': settings.get('session_cookie_name', 'session_id'),
+            'field_store': settings.get('session_field_store')
+        }
+        self._cookie_name = self._static_kw['cookie_name']
+        self._duration = self._static_kw['duration']
         url = settings.get('session_storage', '')
-        connection_timeout = settings.get('connection_timeout', 1)
-
-        if url.startswith('mysql'):
-            if database is None:
-                raise Exception('MySQL no longer supported - was implemented with a VERY old version of tornado')
-            self.storage_class = session.MySQLSession
-
-            u, p, host, d, port = self.storage_class._parse_connection_details(url)
-
-            h = "{0}:{1}".format(host, port)
-
-            self.storage_client = database.Connection(h, d, user=u, password=p)
-
-            if not self.storage_client.get("""show tables like 'tornado_sessions'"""):
-                self.storage_client.execute(  # create table if it doesn't exist
-                    """create table tornado_sessions (
-                    session_id varchar(64) not null primary key,
-                    data longtext,
-                    expires integer,
-                    ip_address varchar(46),
-                    user_agent varchar(255)
-                    );""")
-
-        elif url.startswith('postgresql'):
-            if psycopg2 is None:
-                raise Exception('Postgres not supported, missing the psycopg2 Python package')
-            self.storage_class = session.PostgresSession
-
-            u, p, host, d, port = self.storage_class._parse_connection_details(url)
-            # print "User: {0}".format(u)
-            # print "Host {0}".format(host)
-            # print "Database {0}".format(d)
-
-            self.storage_client = psycopg2.connect(host=host, port=port, database=d, user=u, password=p)
-
-        elif url.startswith('sqlite'):
-            raise NotImplementedError
-        elif url.startswith('memcached'):
-            self.storage_class = session.MemcachedSession
-            self.storage_client = None  # TODO - Figure out how to open a memcached session
-        elif url.startswith('mongodb'):
-            self.storage_class = session.MongoDBSession
-            self.storage_client = None  # TODO - Figure out how to open a mongodb session
-        elif url.startswith('redis') or url.startswith('sentinel'):
-            if redis is None:
-                raise Exception('Redis not supported, missing the redis Python package')
-            self.storage_class = session.RedisSession
-            service_name, p, host, d, port = self.storage_class._parse_connection_details(url)
-            if (service_name):
-                sentinel = redis.sentinel.Sentinel([(host, port)], socket_timeout=connection_timeout)
-                self.storage_client = sentinel.master_for(service_name)
-            else:
-                self.storage_client = redis.Redis(host=host, port=port, db=d, password=p)
-        elif url.startswith('dir'):
-            self.storage_class = session.DirSession
-            self.storage_client = url[6:]
-        elif url.startswith('file'):
-            self.storage_class = session.FileSession
-            self.storage_client = url[7:]
+
+        # read the duration the way BaseSession._expires_at does
+        duration = self._duration
+        if isinstance(duration, datetime.timedelta):
+            duration = duration.total_seconds()
+        elif isinstance(duration, (int, str)):
+            duration = int(duration)
         else:
+            duration = 900
+        self._local_cache = _LocalSessionCache(settings.get('session_cache_size', 4096), min(duration, 5))
+
+        # match the whole scheme, so e.g. rediss:// is not mistaken for redis://
+        init_backend = _BACKENDS.get(url.split('://', 1)[0].lower())
+        if init_backend is None:
             return
 
+        self.storage_class, self.storage_client = init_backend(url, settings)
+
+        # the backend is fixed from here on, so bind its entry points once
+        self._load_session = self.storage_class.load
+        self._new_session = functools.partial(self.storage_class, self.storage_client, **self._static_kw)
+
     def create_session(self, tornado_web, session_id=None):
         """Creates a session handler connection to the persistent storage container
         Current support for: MySQL, Memcached, MongoDB, Redis, Directory, and File sessions"""
         # settings = self.application.settings # just a shortcut
 
-        # logger = plogging.get_logger_adapter(__name__, None, None)
+        session_id = session_id or tornado_web.get_secure_cookie(self._cookie_name)
+        if isinstance(session_id, bytes):  # get_secure_cookie returns bytes
+            session_id = session_id.decode('ascii')
+        request = tornado_web.request
+        ip_address = request.remote_ip
+        user_agent = request.headers.get(_USER_AGENT)
+        local_cache = self._local_cache
 
-        new_session = None
         old_session = None
-
-        session_id = session_id or tornado_web.get_secure_cookie(self.__kw['cookie_name'])
-        ip_address = tornado_web.request.remote_ip
-        user_agent = tornado_web.request.headers.get('User-Agent')
-
-        kw = {'security_model': self.__kw['security_model'],
-              'duration': self.__kw['duration'],
-              'ip_address': ip_address,
-              'user_agent': user_agent,
-              'tornado_web': tornado_web,
-              'regeneration_interval': self.__kw['regeneration_interval'],
-              'catalog': self.__kw['catalog'],
-              'cookie_name': self.__kw['cookie_name'],
-              'field_store': self.__kw['field_store']
-              }
-
-        old_session = self.storage_class.load(session_id, self.storage_client, **kw)
+        if session_id:  # without a cookie there is nothing to load
+            state = local_cache.get(session_id)
+            if state is not None:  # stored by an earlier request, build this request's own session
+                kwargs = dict(state, data=copy.deepcopy(state['data']))
+                old_session = self._new_session(tornado_web=tornado_web, **kwargs)
+            else:
+                old_session = self._load_session(session_id, self.storage_client, ip_address=ip_address,
+                                                 user_agent=user_agent, tornado_web=tornado_web, **self._static_kw)
+                if old_session is not None:
+                    local_cache[session_id] = old_session._state()
 
         if old_session is None or old_session._is_expired():  # create a new session
-            kw['session_id'] = session_id
-            kw['data'] = {}
-            new_session = self.storage_class(self.storage_client, **kw)
-
-        if old_session is not None:
-            if old_session._should_regenerate():
-                old_session.refresh(new_session_id=True)
-            return old_session
+            local_cache.pop(session_id)
+            new_session = self._new_session(ip_address=ip_address, user_agent=user_agent, tornado_web=tornado_web)
+            new_session._cache = local_cache  # cached once it is saved
+            return new_session
 
-        return new_session
+        old_session._cache = local_cache
+        if old_session._should_regenerate():
+            old_session.refresh(new_session_id=True)
+        return old_session
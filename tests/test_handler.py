@@ -0,0 +1,130 @@
+# pylint: disable=redefined-outer-name
+import types
+
+import pytest
+from dustdevil import handler, session
+
+
+class FakeRequestHandler(object):
+
+    def __init__(self, session_id=None):
+        self._session_id = session_id
+        self.request = types.SimpleNamespace(remote_ip='127.0.0.1', headers={'User-Agent': 'SuperCoolBrowser/v1'})
+
+    def get_secure_cookie(self, name):
+        return self._session_id
+
+    def clear_cookie(self, name):
+        self._session_id = None
+
+
+@pytest.fixture
+def session_handler(tmp_path):
+    return handler.Handler({'session_storage': 'dir://' + str(tmp_path)})
+
+
+def test_loaded_session_is_cached(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session['key'] = 'value'
+    new_session.finish()
+
+    def load(*args, **kwargs):
+        raise AssertionError('cached session was loaded from storage')
+    session_handler._load_session = load
+
+    cached = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    assert cached is not new_session
+    assert cached.session_id == new_session.session_id
+    assert cached['key'] == 'value'
+
+
+def test_invalidated_session_is_not_served_from_cache(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session.finish()
+    new_session.invalidate()
+
+    replacement = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    assert replacement is not new_session
+    assert replacement.session_id != new_session.session_id
+
+
+def test_concurrent_requests_get_their_own_session(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session['items'] = ['a']
+    new_session.finish()
+
+    web_a = FakeRequestHandler(new_session.session_id)
+    web_b = FakeRequestHandler(new_session.session_id)
+    session_a = session_handler.create_session(web_a)
+    session_b = session_handler.create_session(web_b)
+    assert session_a is not session_b
+
+    session_a['items'].append('b')
+    assert session_b['items'] == ['a']
+
+    session_a.invalidate()
+    session_a.finish()
+    session_b.finish()
+    assert web_a.get_secure_cookie('session_id') is None
+    assert web_b.get_secure_cookie('session_id') == new_session.session_id
+
+
+def test_bytes_cookie_is_served_from_cache(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session.finish()
+
+    def load(*args, **kwargs):
+        raise AssertionError('cached session was loaded from storage')
+    session_handler._load_session = load
+
+    cached = session_handler.create_session(FakeRequestHandler(new_session.session_id.encode('ascii')))
+    assert cached.session_id == new_session.session_id
+
+
+def test_deleted_session_is_not_served_from_cache(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session.finish()
+    new_session.delete()
+
+    replacement = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    assert replacement.session_id != new_session.session_id
+
+
+def test_explicitly_saved_session_is_cached(session_handler):
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session['key'] = 1
+    new_session.finish()
+
+    loaded = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    loaded['key'] = 2
+    loaded.save()
+    loaded.finish()
+
+    cached = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    assert cached['key'] == 2
+
+
+def test_cache_can_be_turned_off(tmp_path):
+    session_handler = handler.Handler({'session_storage': 'dir://' + str(tmp_path), 'session_cache_size': 0})
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session['key'] = 'value'
+    new_session.finish()
+
+    loaded = session_handler.create_session(FakeRequestHandler(new_session.session_id))
+    assert loaded['key'] == 'value'
+
+
+def test_default_duration(tmp_path):
+    session_handler = handler.Handler({'session_storage': 'dir://' + str(tmp_path), 'duration': None})
+    new_session = session_handler.create_session(FakeRequestHandler())
+    assert new_session.duration.total_seconds() == 900
+
+
+def test_sqlite_url_uses_file_sessions(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    session_handler = handler.Handler({'session_storage': 'sqlite://' + path})
+    assert session_handler.storage_class is session.FileSession
+    new_session = session_handler.create_session(FakeRequestHandler())
+    new_session['key'] = 'value'
+    new_session.finish()
+    assert session.FileSession.load(new_session.session_id, path)['key'] == 'value'
@@ -0,0 +1,148 @@
+# pylint: disable=redefined-outer-name
+import contextlib
+import datetime
+import gc
+import sys
+import types
+import weakref
+
+import pytest
+from dustdevil import session
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.values = {}
+        self.times = {}
+        self.writes = []
+
+    def set(self, key, value, time=0):
+        self.values[key] = value
+        self.times[key] = time
+        self.writes.append(key)
+
+    def set_multi(self, mapping, time=0):
+        for key, value in mapping.items():
+            self.set(key, value, time)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def get_multi(self, keys):
+        return {key: self.values[key] for key in keys if key in self.values}
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class FakeClientPool(object):
+
+    def __init__(self):
+        self.client = FakeClient()
+
+    def reserve(self):
+        return contextlib.nullcontext(self.client)
+
+
+class FakeError(Exception):
+    pass
+
+
+class FakePylibmcPool(object):
+
+    def __init__(self, client, size):
+        self.client = client
+        self.size = size
+
+
+@pytest.fixture
+def pool():
+    return FakeClientPool()
+
+
+@pytest.fixture
+def pylibmc(monkeypatch):
+    module = types.SimpleNamespace(Error=FakeError, Client=lambda servers, **kwargs: servers,
+                                   ClientPool=FakePylibmcPool)
+    monkeypatch.setitem(sys.modules, 'pylibmc', module)
+    return module
+
+
+def test_unchanged_session_is_not_written_again(pool):
+    s = session.MemcachedSession(pool, duration=3600)
+    s['key'] = 'value'
+    s.save()
+    s['key'] = 'value'
+    s.save()
+    assert pool.client.writes == [s.session_id]
+
+
+def test_refreshed_expiry_is_written(pool):
+    s = session.MemcachedSession(pool, duration=60)
+    s.save()
+    s._now += datetime.timedelta(seconds=40)  # past half the duration
+    s.refresh()
+    assert pool.client.writes == [s.session_id] * 2
+
+
+def test_expiry_time(pool):
+    s = session.MemcachedSession(pool, duration=3600)
+    s.save()
+    assert 3590 < pool.client.times[s.session_id] <= 3600
+
+
+def test_expiry_over_30_days_is_a_timestamp(pool):
+    s = session.MemcachedSession(pool, duration=40 * 24 * 3600)
+    s.save()
+    assert pool.client.times[s.session_id] == s._expires_timestamp()
+
+
+def test_shortened_expiry_is_written(pool):
+    s = session.MemcachedSession(pool, duration=3600)
+    s.save()
+    s.refresh(duration=30)
+    assert pool.client.writes == [s.session_id] * 2
+
+
+def test_load_many(pool, pylibmc):
+    first = session.MemcachedSession(pool, duration=3600)
+    first['key'] = 'value'
+    second = session.MemcachedSession(pool, duration=3600)
+    session.MemcachedSession.save_many(pool, [first, second])
+    pool.client.values['corrupt'] = b'not a session'
+    pool.client.values['empty'] = b''
+
+    loaded = session.MemcachedSession.load_many(
+        iter([first.session_id, second.session_id, 'corrupt', 'empty', 'missing']), pool)
+    assert sorted(loaded) == sorted([first.session_id, second.session_id])
+    assert loaded[first.session_id]['key'] == 'value'
+    assert not loaded[first.session_id].dirty
+
+    # loaded sessions know what is stored, so saving them again is skipped
+    loaded[first.session_id].dirty = True
+    loaded[first.session_id].save()
+    assert pool.client.writes == [first.session_id, second.session_id]
+
+
+def test_load_many_when_memcached_fails(pool, pylibmc):
+    def get_multi(keys):
+        raise FakeError('server down')
+    pool.client.get_multi = get_multi
+    assert session.MemcachedSession.load_many(['some_id'], pool) == {}
+
+
+def test_client_pool_is_shared(pylibmc):
+    pool = session.MemcachedSession.get_client_pool(['10.0.0.1', '10.0.0.2'], 8)
+    assert session.MemcachedSession.get_client_pool(('10.0.0.1', '10.0.0.2'), 8) is pool
+    assert session.MemcachedSession.get_client_pool(['10.0.0.1', '10.0.0.2'], 16) is not pool
+    assert session.MemcachedSession.get_client_pool(['10.0.0.1'], 8) is not pool
+
+
+def test_client_pool_is_released_with_its_last_user(pylibmc):
+    pool = session.MemcachedSession.get_client_pool(['10.0.0.3'], 8)
+    released = weakref.ref(pool)
+    del pool
+    gc.collect()
+    assert released() is None
+    assert session.MemcachedSession.get_client_pool(['10.0.0.3'], 8).client == ['10.0.0.3']
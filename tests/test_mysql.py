@@ -0,0 +1,73 @@
+# pylint: disable=redefined-outer-name
+import pytest
+from dustdevil import session
+
+
+class FakeConnection(object):
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, values):
+        self._pool.queries.append((query, values))
+
+    def commit(self):
+        self._pool.commits += 1
+
+    def close(self):
+        self._pool.closed += 1
+
+
+class FakePooledDB(object):
+
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+        self.closed = 0
+
+    def connection(self):
+        return FakeConnection(self)
+
+
+@pytest.fixture
+def pool():
+    return FakePooledDB()
+
+
+def test_upsert_writes_all_rows_in_one_query(pool):
+    rows = [{'session_id': 'a', 'expires': 1}, {'session_id': 'b', 'expires': 2}]
+    session.MySQLSession._upsert(pool, ('session_id', 'expires'), rows)
+
+    assert pool.queries == [(
+        "INSERT INTO tornado_sessions (session_id, expires) VALUES (%s, %s), (%s, %s)"
+        " on duplicate key update session_id=values(session_id), expires=values(expires);",
+        ['a', 1, 'b', 2])]
+    assert pool.commits == pool.closed == 1
+
+
+def test_save_many_groups_rows_by_columns(pool):
+    field_store = {'USER_ID': 'user_id'}
+    sessions = [session.MySQLSession(pool, field_store=field_store) for _ in range(3)]
+    sessions[0]['user_id'] = 1
+    sessions[1]['user_id'] = 2
+    clean = session.MySQLSession(pool)
+    clean.dirty = False
+
+    session.MySQLSession.save_many(pool, sessions + [clean])
+
+    assert len(pool.queries) == 2
+    with_user, without_user = sorted(pool.queries, key=lambda q: -len(q[1]))
+    assert with_user[0].startswith(
+        "INSERT INTO tornado_sessions (session_id, data, expires, ip_address, user_agent, USER_ID)"
+        " VALUES (%s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s) ")
+    assert with_user[1][0::6] == [sessions[0].session_id, sessions[1].session_id]
+    assert with_user[1][5::6] == [1, 2]
+    assert without_user[0].startswith(
+        "INSERT INTO tornado_sessions (session_id, data, expires, ip_address, user_agent)"
+        " VALUES (%s, %s, %s, %s, %s) ")
+    assert without_user[1][0] == sessions[2].session_id
+    assert not any(s.dirty for s in sessions)
+    assert pool.closed == 2
@@ -2,6 +2,7 @@
 import pytest
 from redis.sentinel import Sentinel
 from dustdevil import handler
+from dustdevil.session import RedisSession
 
 # @pytest.fixture
 # def client():
@@ -30,6 +31,58 @@ TEST_SETTINGS = {
 }
 
 
+def test_handlers_share_redis_client():
+    settings = {'session_storage': 'redis://localhost:6379/0'}
+    first = handler.Handler(settings)
+    second = handler.Handler(dict(settings))
+    assert first.storage_client is second.storage_client
+
+
+class FakePipeline(object):
+
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def get(self, key):
+        self._commands.append(lambda: self._store.get(key))
+
+    def set(self, key, value, ex=None):
+        self._commands.append(lambda: self._store.__setitem__(key, value))
+
+    def execute(self):
+        results = [command() for command in self._commands]
+        self._commands = []
+        return results
+
+
+class FakeRedis(object):
+
+    def __init__(self):
+        self.store = {}
+        self.pipelines = 0
+
+    def pipeline(self, transaction=True):
+        self.pipelines += 1
+        return FakePipeline(self.store)
+
+
+def test_save_many_and_load_many():
+    connection = FakeRedis()
+    sessions = [RedisSession(connection, duration=60) for _ in range(3)]
+    for i, s in enumerate(sessions):
+        s['i'] = i
+    RedisSession.save_many(connection, sessions)
+    assert connection.pipelines == 1
+    assert all(not s.dirty for s in sessions)
+
+    connection.store['corrupt'] = b'not a session'
+    loaded = RedisSession.load_many((s.session_id for s in sessions + [RedisSession(connection)]),
+                                    connection)
+    assert {session_id: s['i'] for session_id, s in loaded.items()} == {s.session_id: s['i'] for s in sessions}
+    assert RedisSession.load_many(['corrupt', 'missing'], connection) == {}
+
+
 @pytest.mark.skip(reason="Currently cannot test this as there is no mymaster redis")
 def test_sentinel(capsys):
     session_handler = handler.Handler(TEST_SETTINGS)
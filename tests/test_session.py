@@ -0,0 +1,125 @@
+# pylint: disable=redefined-outer-name
+import datetime
+
+import pytest
+from dustdevil import session
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Records the session_id of every DirSession write."""
+    written = []
+    original_save = session.DirSession.save
+
+    def counting_save(self):
+        if self.dirty:
+            written.append(self.session_id)
+        original_save(self)
+
+    monkeypatch.setattr(session.DirSession, 'save', counting_save)
+    return written
+
+
+@pytest.fixture
+def stored_session(tmp_path, saves):
+    new_session = session.DirSession(str(tmp_path), duration=900)
+    new_session['USER_ID'] = 42
+    new_session.save()
+    del saves[:]
+    return session.DirSession.load(new_session.session_id, str(tmp_path))
+
+
+def test_loaded_session_is_clean(stored_session):
+    assert stored_session['USER_ID'] == 42
+    assert not stored_session.dirty
+
+
+def test_refresh_skips_save_for_small_expiry_change(stored_session, saves):
+    stored_session.finish()
+    assert saves == []
+
+
+def test_refresh_saves_changed_session(stored_session, saves):
+    stored_session['USER_ID'] = 43
+    stored_session.finish()
+    assert saves == [stored_session.session_id]
+    assert not stored_session.dirty
+
+
+def test_refresh_saves_when_expiry_moves_far_enough(stored_session, saves):
+    stored_session.expires -= datetime.timedelta(minutes=5)
+    stored_session.finish()
+    assert saves == [stored_session.session_id]
+
+
+def test_new_session_is_saved_once_on_finish(tmp_path, saves):
+    new_session = session.DirSession(str(tmp_path), duration=900)
+    assert saves == []
+    new_session.finish()
+    assert saves == [new_session.session_id]
+    assert session.DirSession.load(new_session.session_id, str(tmp_path)) is not None
+
+
+def test_serialize_omits_default_fields(tmp_path):
+    new_session = session.DirSession(str(tmp_path), duration=900, regeneration_interval=240)
+    dump = session.DirSession.deserialize(new_session.serialize())
+    assert isinstance(dump['expires'], int)
+    assert not {'ip_address', 'user_agent', 'security_model', 'regeneration_interval'} & set(dump)
+
+    loaded = session.DirSession(str(tmp_path), **dump)
+    assert loaded.expires == new_session.expires.replace(microsecond=0)
+    assert loaded.regeneration_interval == datetime.timedelta(seconds=240)
+    assert loaded.ip_address is None
+
+
+def test_serialize_round_trips_datetimes(tmp_path):
+    new_session = session.DirSession(str(tmp_path), duration=900)
+    new_session['LOGGED_IN'] = datetime.datetime(2020, 1, 2, 3, 4, 5, 6)
+    new_session['IDLE'] = datetime.timedelta(days=1, seconds=2, microseconds=3)
+    dump = session.DirSession.deserialize(new_session.serialize())
+    assert dump['data'] == new_session.data
+    assert dump['duration'] == datetime.timedelta(seconds=900)
+
+
+def test_large_redis_values_are_compressed():
+    pytest.importorskip('zstandard')
+    new_session = session.RedisSession(None, duration=900)
+    new_session['BLOB'] = 'x' * 4096
+    value = new_session.serialize()
+    assert value[:1] == b'\x01'
+    assert len(value) < 4096
+    assert session.RedisSession.deserialize(value)['data'] == new_session.data
+
+
+def test_dir_session_delete_expired(tmp_path):
+    live = session.DirSession(str(tmp_path), duration=900)
+    live.save()
+    expired = session.DirSession(str(tmp_path), duration=900)
+    expired.expires -= datetime.timedelta(hours=1)
+    expired.save()
+    (tmp_path / 'unrelated.txt').write_text('keep')
+
+    session.DirSession.delete_expired(str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [live.session_id + '.session', 'unrelated.txt'])
+
+
+def test_unserializable_dir_session_leaves_no_file(tmp_path):
+    new_session = session.DirSession(str(tmp_path), duration=900)
+    new_session['tags'] = {'a', 'b'}  # sets are not supported
+    with pytest.raises(TypeError):
+        new_session.save()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_file_session_round_trip(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    new_session = session.FileSession(path, duration=900)
+    new_session['USER_NAME'] = 'someone'
+    new_session.save()
+
+    loaded = session.FileSession.load(new_session.session_id, path)
+    assert loaded.data == {'USER_NAME': 'someone'}
+
+    loaded.delete()
+    assert session.FileSession.load(new_session.session_id, path) is None